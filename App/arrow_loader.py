@@ -0,0 +1,289 @@
+'''
+Carga de resultados do Postgres direto para Arrow. Este módulo não depende do Streamlit.
+
+Queries com parâmetros rodam normalmente, com os parâmetros vinculados no servidor (e, depois de
+DB_PREPARE_THRESHOLD execuções, como prepared statements): as linhas chegam em lotes e cada coluna vira um array
+do Arrow. Queries sem parâmetros rodam dentro de COPY ... TO STDOUT em CSV, e o texto recebido é convertido em
+blocos pelo leitor de CSV do Arrow, em C++, sem criar um objeto Python por célula; o COPY não aceita parâmetros.
+
+Os tipos das colunas vêm da descrição do resultado, não de inferência: NUMERIC/DECIMAL viram float64 (como no
+pd.read_sql), e o DataFrame usa dtypes do pandas apoiados em Arrow.
+'''
+
+import io
+import re
+import threading
+import time
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+from psycopg.types.numeric import FloatLoader
+
+# Tipo Arrow de cada tipo do Postgres (OID); os demais chegam como texto
+ARROW_TYPES = {
+    16: pa.bool_(), # boolean
+    25: pa.string(), # text
+    1042: pa.string(), # char
+    1043: pa.string(), # varchar
+    20: pa.int64(), # bigint
+    21: pa.int16(), # smallint
+    23: pa.int32(), # integer
+    700: pa.float32(), # real
+    701: pa.float64(), # double precision
+    1700: pa.float64(), # numeric/decimal
+    1082: pa.date32(), # date
+    1114: pa.timestamp('us'), # timestamp
+    1184: pa.timestamp('us', tz='UTC'), # timestamptz
+}
+
+PARAM_PATTERN = re.compile(r'(?<!:):(\w+)')
+
+BATCH_ROWS = 65_536 # Linhas por lote nas queries com parâmetros
+
+# Schema do resultado de cada query sem parâmetros (pelo texto do SQL), para o COPY, que não descreve o resultado
+COPY_SCHEMAS = {}
+COPY_SCHEMAS_LOCK = threading.Lock()
+
+
+def to_psycopg_sql(query, params):
+    '''
+    Troca os parâmetros :nome (formato do SQLAlchemy) por %(nome)s e retorna (sql, params usados pela query). Sem
+    parâmetros, o SQL fica como está (o psycopg só interpreta o % quando recebe parâmetros).
+    '''
+    names = set(PARAM_PATTERN.findall(query))
+    used_params = {name: value for name, value in (params or {}).items() if name in names}
+    if not used_params:
+        return query, used_params
+    sql = PARAM_PATTERN.sub(lambda m: f"%({m.group(1)})s" if m.group(1) in used_params else m.group(0), query.replace('%', '%%'))
+    return sql, used_params
+
+
+def schema_of(description):
+    'Schema do Arrow a partir da descrição do resultado (cursor.description)'
+    return pa.schema([
+        pa.field(column.name, ARROW_TYPES.get(column.type_code, pa.string()))
+        for column in description
+    ])
+
+
+def float_decimals(schema):
+    'O schema com as colunas decimais (ex.: do DuckDB) como float64, como na carga do Postgres'
+    return pa.schema([
+        pa.field(field.name, pa.float64()) if pa.types.is_decimal(field.type) else field
+        for field in schema
+    ])
+
+
+def to_pandas(table):
+    'DataFrame com dtypes apoiados em Arrow; decimais (ex.: do DuckDB) viram float64, como no Postgres'
+    return table.cast(float_decimals(table.schema)).to_pandas(types_mapper=pd.ArrowDtype)
+
+
+class CopyStream(io.RawIOBase):
+    '''
+    Arquivo somente leitura sobre os blocos de um COPY TO STDOUT (uma linha do resultado por bloco), medindo o
+    tempo de espera pelo servidor. Cada leitura junta blocos até o tamanho pedido.
+    '''
+
+    def __init__(self, copy):
+        self.blocks = iter(copy)
+        self.pending = b''
+        self.bytes_read = 0
+        self.wait_seconds = 0.0
+
+    def readable(self):
+        return True
+
+    def next_block(self):
+        'Próximo bloco recebido do servidor, ou None no fim do resultado'
+        started = time.perf_counter()
+        block = next(self.blocks, None)
+        self.wait_seconds += time.perf_counter() - started
+        return block
+
+    def at_end(self):
+        'Indica se o resultado acabou'
+        while not self.pending:
+            block = self.next_block()
+            if block is None:
+                return True
+            self.pending = bytes(block)
+        return False
+
+    def read(self, size=-1):
+        parts = [self.pending]
+        length = len(self.pending)
+        while size < 0 or length < size:
+            block = self.next_block()
+            if block is None:
+                break
+            parts.append(block)
+            length += len(block)
+
+        data = b''.join(parts)
+        if size >= 0:
+            data, self.pending = data[:size], data[size:]
+        else:
+            self.pending = b''
+        self.bytes_read += len(data)
+        return data
+
+    def readinto(self, buffer):
+        data = self.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+
+def copy_schema(connection, query):
+    '''
+    Schema do resultado da query sem parâmetros. Na primeira vez, o servidor só planeja a query (LIMIT 0) para
+    descrever o resultado; depois, o schema vem de COPY_SCHEMAS.
+    '''
+    with COPY_SCHEMAS_LOCK:
+        schema = COPY_SCHEMAS.get(query)
+    if schema is None:
+        schema = schema_of(connection.execute(f"SELECT * FROM ({query}) q LIMIT 0").description)
+        with COPY_SCHEMAS_LOCK:
+            COPY_SCHEMAS[query] = schema
+    return schema
+
+
+class ArrowQueryReader:
+    '''
+    Lê o resultado de uma query (parâmetros :nome) na conexão psycopg como RecordBatches do Arrow, sem juntar o
+    resultado inteiro: lotes de block_size bytes de CSV (query sem parâmetros, via COPY) ou de batch_rows linhas
+    (query com parâmetros). Uso:
+
+        with ArrowQueryReader(connection, query, params) as reader:
+            for batch in reader: ...
+
+    Com server_cursor, as linhas de uma query com parâmetros vêm do servidor aos poucos (cursor no servidor, sem
+    prepared statement), em vez de chegarem todas na execução: para resultados grandes, como as exportações.
+
+    reader.schema já está disponível antes do primeiro lote, e reader.stats() depois de ler todos.
+    '''
+
+    def __init__(self, connection, query, params=None, block_size=1 << 20, batch_rows=BATCH_ROWS, server_cursor=False):
+        self.started = time.perf_counter()
+        self.connection = connection
+        self.sql, self.params = to_psycopg_sql(query, params)
+        self.block_size = block_size
+        self.batch_rows = batch_rows
+        self.server_cursor = server_cursor
+        self.stream = None
+        self.wait_seconds = 0.0
+        self.rows = 0
+        self.arrow_bytes = 0
+
+    def __enter__(self):
+        if not self.params:
+            self.schema = copy_schema(self.connection, self.sql)
+            self.copy = self.connection.cursor().copy(f"COPY ({self.sql}) TO STDOUT (FORMAT csv)")
+            self.stream = CopyStream(self.copy.__enter__())
+            return self
+
+        self.cursor = self.connection.cursor(name=f"arrow_{id(self):x}") if self.server_cursor else self.connection.cursor()
+        self.cursor.adapters.register_loader('numeric', FloatLoader) # Direto para float, sem Decimal
+        started = time.perf_counter()
+        self.cursor.execute(self.sql, self.params)
+        self.wait_seconds += time.perf_counter() - started
+        self.schema = schema_of(self.cursor.description)
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.stream is not None:
+            return self.copy.__exit__(*exc_info)
+        self.cursor.close()
+
+    def __iter__(self):
+        batches = self.copy_batches() if self.stream is not None else self.cursor_batches()
+        for batch in batches:
+            self.rows += batch.num_rows
+            self.arrow_bytes += batch.nbytes
+            yield batch
+
+    def copy_batches(self):
+        'Lotes decodificados do CSV do COPY'
+        if self.stream.at_end():
+            return # Nenhuma linha: o leitor de CSV não aceita um arquivo vazio
+
+        yield from pa_csv.open_csv(
+            self.stream,
+            read_options=pa_csv.ReadOptions(column_names=self.schema.names, block_size=self.block_size),
+            convert_options=pa_csv.ConvertOptions(
+                column_types=dict(zip(self.schema.names, self.schema.types)),
+                # No CSV do COPY, NULL é um campo vazio sem aspas; "" é o texto vazio, e "NA" ou "null" são texto
+                null_values=[''],
+                strings_can_be_null=True,
+                quoted_strings_can_be_null=False,
+                true_values=['t'],
+                false_values=['f'],
+            ),
+        )
+
+    def cursor_batches(self):
+        'Lotes montados coluna a coluna a partir das linhas do cursor'
+        # Tipos sem equivalente em ARROW_TYPES chegam como texto, como no COPY
+        text_columns = [column.type_code not in ARROW_TYPES for column in self.cursor.description]
+        while True:
+            started = time.perf_counter()
+            rows = self.cursor.fetchmany(self.batch_rows)
+            self.wait_seconds += time.perf_counter() - started
+            if not rows:
+                return
+
+            columns = zip(*rows)
+            yield pa.RecordBatch.from_arrays([
+                pa.array([None if value is None else str(value) for value in values] if text else values, type=field.type)
+                for values, field, text in zip(columns, self.schema, text_columns)
+            ], schema=self.schema)
+
+    def stats(self):
+        'Linhas, bytes recebidos (só no COPY), bytes em Arrow e segundos esperando o servidor e decodificando'
+        wait_seconds = self.stream.wait_seconds if self.stream is not None else self.wait_seconds
+        total_seconds = time.perf_counter() - self.started
+        return {
+            'linhas': self.rows,
+            'bytes_recebidos': self.stream.bytes_read if self.stream is not None else 0,
+            'bytes_arrow': self.arrow_bytes,
+            'segundos_servidor': wait_seconds,
+            'segundos_decodificando': total_seconds - wait_seconds,
+        }
+
+
+def read_arrow(connection, query, params=None, block_size=1 << 20):
+    '''
+    Executa a query (parâmetros :nome) na conexão psycopg e retorna (pyarrow.Table, estatísticas), lendo o resultado
+    em lotes (ver ArrowQueryReader).
+    '''
+    with ArrowQueryReader(connection, query, params, block_size) as reader:
+        table = pa.Table.from_batches(list(reader), schema=reader.schema)
+    return table, reader.stats()
+
+
+class LoadStats:
+    'Totais das estatísticas de read_arrow, somadas por várias threads'
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.queries = 0
+        self.totals = {}
+
+    def add(self, stats):
+        with self.lock:
+            self.queries += 1
+            for key, value in stats.items():
+                self.totals[key] = self.totals.get(key, 0) + value
+
+    def as_dict(self):
+        with self.lock:
+            totals = dict(self.totals)
+            return {
+                'queries': self.queries,
+                'linhas': totals.get('linhas', 0),
+                'mb_recebidos': round(totals.get('bytes_recebidos', 0) / 1024**2, 2),
+                'mb_arrow': round(totals.get('bytes_arrow', 0) / 1024**2, 2),
+                'segundos_servidor': round(totals.get('segundos_servidor', 0), 3),
+                'segundos_decodificando': round(totals.get('segundos_decodificando', 0), 3),
+            }
@@ -0,0 +1,227 @@
+'''
+Benchmark das queries do dashboard: monta o SQL com a mesma lógica do app (Filters e as funções de queries.py)
+para uma matriz de filtros realistas, executa cada query várias vezes e grava p50/p95/máximo e linhas em JSON,
+para comparar commits.
+
+Use um banco gerado com semente e escala fixas, por exemplo:
+
+    python generate_data.py --bench 1m --rollups --db-url postgresql://...
+    python App/benchmark.py --db-url postgresql+psycopg://... --output bench-queries.json
+    python App/benchmark.py --db-url postgresql+psycopg://... --compare bench-queries.json
+
+Os filtros (loja, produtos, período) são escolhidos a partir dos dados, de forma determinística: o mesmo banco
+gera sempre a mesma matriz. O período "tudo" vai de MIN_DATE até o último dia com vendas (e não até hoje).
+
+O resumo é medido em SQL em todos os casos, embora o app o calcule pelo cubo em memória quando não há filtro de
+produto: o cubo aparece como uma query à parte, que o app faz uma vez.
+'''
+
+import argparse
+import datetime
+import json
+import platform
+import subprocess
+import time
+
+import numpy as np
+import pandas as pd
+import sqlalchemy
+
+from settings import *
+from queries import *
+from arrow_loader import read_arrow, to_pandas
+from product_index import ProductSaleIndex
+
+# Dimensões da matriz: nome -> argumentos de Filters (além do período); None significa "todos"
+FILTER_CASES = {
+    'vazio': {},
+    'uma loja': {'store_ids': 'busiest_store'},
+    'vários produtos': {'product_ids': 'top_products'},
+    'horário estreito': {'time_start': 19, 'time_end': 21},
+    'dias úteis': {'day_numbers': [1, 2, 3, 4, 5]},
+    'cancelados': {'statuses': ['CANCELLED']},
+    'padrão (COMPLETED)': {'statuses': ['COMPLETED']},
+}
+PERIOD_CASES = ['1 mês', 'tudo']
+TOP_PRODUCTS = 3 # Produtos mais vendidos usados no caso "vários produtos"
+
+BUSIEST_STORE_QUERY = "SELECT store_id FROM sales GROUP BY store_id ORDER BY COUNT(*) DESC, store_id LIMIT 1"
+TOP_PRODUCTS_QUERY = """
+    SELECT product_id FROM product_sales GROUP BY product_id ORDER BY COUNT(*) DESC, product_id LIMIT :limit
+"""
+SALES_PERIOD_QUERY = "SELECT MIN(created_at)::date as primeiro_dia, MAX(created_at)::date as ultimo_dia, COUNT(*) as vendas FROM sales"
+GENERATOR_RUN_QUERY = """
+    SELECT seed, start_day, end_day FROM generator_runs
+    ORDER BY id DESC LIMIT 1
+"""
+
+
+def run_query(engine, query, params=None):
+    'Executa a query como o load_data do app (carga via Arrow, ou pd.read_sql) e retorna o DataFrame'
+    with engine.connect() as connection:
+        if ARROW_LOADING and engine.dialect.driver == 'psycopg':
+            table, _ = read_arrow(connection.connection.driver_connection, query, params, ARROW_BLOCK_SIZE)
+            return to_pandas(table)
+        return pd.read_sql(sqlalchemy.text(query), connection, params=params)
+
+
+def database_info(engine):
+    'Recursos do schema e dados de referência do banco, como o app os descobre (ver app.load_lookups)'
+    schema = run_query(engine, SCHEMA_FEATURES_QUERY).iloc[0]
+    rollup_available = False
+    if USE_ROLLUP and bool(run_query(engine, ROLLUP_AVAILABLE_QUERY)['existe'].all()):
+        rollup_available = bool(run_query(engine, ROLLUP_UP_TO_DATE_QUERY)['em_dia'].all())
+
+    period = run_query(engine, SALES_PERIOD_QUERY).iloc[0]
+    try:
+        generator_run = run_query(engine, GENERATOR_RUN_QUERY).to_dict('records')
+    except Exception:
+        generator_run = [] # Banco sem as tabelas do gerador
+    return {
+        'sales_partitioned': bool(schema['particionado']),
+        'time_columns': bool(schema['colunas_de_tempo']),
+        'rollup_available': rollup_available,
+        'primeiro_dia': period['primeiro_dia'],
+        'ultimo_dia': period['ultimo_dia'],
+        'vendas': int(period['vendas']),
+        'execucao_do_gerador': generator_run[0] if generator_run else None,
+        'busiest_store': [int(run_query(engine, BUSIEST_STORE_QUERY).iloc[0, 0])],
+        'top_products': run_query(engine, TOP_PRODUCTS_QUERY, {'limit': TOP_PRODUCTS})['product_id'].astype(int).tolist(),
+    }
+
+
+def build_filters(info, case, period, product_index):
+    'Filters do caso, como Main.build_filters: com filtro de produto, usa o índice em memória se couber'
+    arguments = {name: info[value] if isinstance(value, str) else value for name, value in FILTER_CASES[case].items()}
+
+    end_date = info['ultimo_dia']
+    start_date = end_date - datetime.timedelta(days=29) if period == '1 mês' else datetime.date.fromisoformat(MIN_DATE)
+
+    sale_ids = None
+    if USE_PRODUCT_INDEX and arguments.get('product_ids') is not None:
+        matched = product_index.sale_ids(arguments['product_ids'])
+        if len(matched) <= PRODUCT_INDEX_MAX_SALE_IDS:
+            sale_ids = matched.tolist()
+
+    return Filters(
+        store_ids=arguments.get('store_ids'),
+        channel_ids=None,
+        product_ids=arguments.get('product_ids'),
+        statuses=arguments.get('statuses'),
+        day_numbers=arguments.get('day_numbers', list(WEEK_DAYS_MAP.values())),
+        start_date=start_date,
+        end_date=end_date,
+        time_start=arguments.get('time_start', 0),
+        time_end=arguments.get('time_end', 24),
+        rollup_available=info['rollup_available'],
+        sale_ids=sale_ids,
+        sales_partitioned=info['sales_partitioned'],
+        time_columns=info['time_columns'],
+    )
+
+
+def benchmark_cases(info, product_index):
+    'Gera (caso, consulta, sql, params): o cubo uma vez, e o resumo e os produtos de cada filtro × período'
+    limit = LIMIT_LIST_VIEW_AMOUNT if LIMIT_LIST_VIEW else None
+    yield 'sem filtros', 'cubo', *cube_query(info['rollup_available'], info['time_columns'])
+    for case in FILTER_CASES:
+        for period in PERIOD_CASES:
+            filters = build_filters(info, case, period, product_index)
+            name = f"{case}, {period}"
+            yield name, 'resumo (visão geral e lojas)', *sales_summary_query(filters)
+            yield name, 'produtos', *product_query(filters, limit)
+
+
+def measure(engine, query, params, repeat, warmup):
+    'Executa a query warmup vezes sem medir e repeat vezes medindo; retorna (segundos de cada execução, linhas)'
+    for _ in range(warmup):
+        run_query(engine, query, params)
+    seconds = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        df = run_query(engine, query, params)
+        seconds.append(time.perf_counter() - started)
+    return seconds, len(df)
+
+
+def git_commit():
+    'Commit atual do repositório, se houver'
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, previous_path):
+    'Mostra a razão entre o p50 de cada query e o do arquivo JSON de uma execução anterior'
+    with open(previous_path) as f:
+        previous = {(r['caso'], r['consulta']): r for r in json.load(f)['resultados']}
+
+    print(f"\nComparação com {previous_path} (p50 atual / p50 anterior):")
+    for result in results:
+        before = previous.get((result['caso'], result['consulta']))
+        if before is None or not before['p50_ms']:
+            continue
+        ratio = result['p50_ms'] / before['p50_ms']
+        print(f"  {result['caso']:<32} {result['consulta']:<30} {ratio:>6.2f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark das queries do dashboard')
+    parser.add_argument('--db-url', default=DB_URL, help='URL do banco (SQLAlchemy), por padrão DB_URL de settings.py')
+    parser.add_argument('--repeat', type=int, default=10, help='Execuções medidas de cada query')
+    parser.add_argument('--warmup', type=int, default=1, help='Execuções antes de medir, para aquecer os caches do banco')
+    parser.add_argument('--output', default='bench-queries.json', help='Arquivo JSON com os resultados')
+    parser.add_argument('--compare', default=None, help='JSON de uma execução anterior, para comparar os p50')
+    args = parser.parse_args()
+
+    engine = sqlalchemy.create_engine(args.db_url)
+    info = database_info(engine)
+    product_index = ProductSaleIndex()
+    if USE_PRODUCT_INDEX:
+        product_index.refresh(lambda query, params: run_query(engine, query, params))
+
+    print(f"{info['vendas']:,} vendas de {info['primeiro_dia']} a {info['ultimo_dia']} "
+          f"(agregada: {info['rollup_available']}, colunas de tempo: {info['time_columns']}, particionado: {info['sales_partitioned']})")
+    print(f"{'caso':<32} {'consulta':<30} {'p50 ms':>9} {'p95 ms':>9} {'máx ms':>9} {'linhas':>9}")
+
+    results = []
+    for case, query_name, query, params in benchmark_cases(info, product_index):
+        seconds, rows = measure(engine, query, params, args.repeat, args.warmup)
+        milliseconds = np.array(seconds) * 1000
+        result = {
+            'caso': case,
+            'consulta': query_name,
+            'p50_ms': round(float(np.percentile(milliseconds, 50)), 3),
+            'p95_ms': round(float(np.percentile(milliseconds, 95)), 3),
+            'max_ms': round(float(milliseconds.max()), 3),
+            'linhas': rows,
+            'execucoes': args.repeat,
+        }
+        results.append(result)
+        print(f"{case:<32} {query_name:<30} {result['p50_ms']:>9.1f} {result['p95_ms']:>9.1f} {result['max_ms']:>9.1f} {rows:>9,}")
+
+    metadata = {
+        'commit': git_commit(),
+        'gerado_em': datetime.datetime.now(),
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'repeticoes': args.repeat,
+        'aquecimento': args.warmup,
+        'configuracao': {
+            'ARROW_LOADING': ARROW_LOADING, 'USE_ROLLUP': USE_ROLLUP, 'USE_PRODUCT_INDEX': USE_PRODUCT_INDEX,
+            'PRODUCT_INDEX_MAX_SALE_IDS': PRODUCT_INDEX_MAX_SALE_IDS, 'MIN_DATE': MIN_DATE,
+        },
+        'banco': {key: value for key, value in info.items() if key not in ('busiest_store', 'top_products')},
+        'filtros': {'loja': info['busiest_store'], 'produtos': info['top_products']},
+    }
+    with open(args.output, 'w') as f:
+        json.dump({**metadata, 'resultados': results}, f, indent=2, default=str, ensure_ascii=False)
+    print(f"Resultados gravados em {args.output}")
+
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,137 @@
+'''
+Cubo em memória com as vendas agregadas por dia × hora × loja × canal × status (ver cube_query). Este módulo
+não depende do Streamlit.
+
+Mudar lojas, canais, status, dias da semana, período ou horário só recorta os mesmos fatos: o cubo responde
+essas mudanças com máscaras e somas vetorizadas, sem ir ao banco. O filtro de produto precisa das vendas
+individuais, então não é respondido pelo cubo.
+'''
+
+import datetime
+
+import numpy as np
+import pandas as pd
+
+from queries import SUMMARY_GROUP_TOTAL, SUMMARY_GROUP_DAY, SUMMARY_GROUP_STORE
+
+EPOCH = datetime.date(1970, 1, 1)
+
+# Tipos compactos das colunas do cubo, para ocupar menos memória no cache
+CUBE_DTYPES = {
+    'dia': np.int32,
+    'hora': np.int8,
+    'dia_semana': np.int8,
+    'store_id': np.int32,
+    'channel_id': np.int32,
+    'sale_status_desc': 'category',
+    'total_vendas': np.int64,
+    'faturamento': np.float64,
+    'soma_entrega': np.float64,
+    'qtd_entrega': np.int64,
+}
+
+
+def compact_cube(cube_df):
+    'Converte o resultado de cube_query para os tipos de CUBE_DTYPES (somas nulas viram 0)'
+    cube_df = cube_df.fillna({'faturamento': 0, 'soma_entrega': 0, 'qtd_entrega': 0})
+    return cube_df.astype(CUBE_DTYPES)
+
+
+class SalesCube:
+    '''
+    Responde sales_summary_query em memória, a partir do resultado compactado de cube_query.
+
+    As lojas são agrupadas pelo nome (lojas com o mesmo nome são somadas, como no GROUP BY st.name), e fatos de
+    lojas fora de stores_df são ignorados, como no JOIN com stores.
+    '''
+
+    def __init__(self, cube_df, stores_df):
+        self.cube_df = cube_df
+        self.dia = cube_df['dia'].to_numpy()
+        self.hora = cube_df['hora'].to_numpy()
+        self.dia_semana = cube_df['dia_semana'].to_numpy()
+        self.store_id = cube_df['store_id'].to_numpy()
+        self.channel_id = cube_df['channel_id'].to_numpy()
+        self.status = cube_df['sale_status_desc']
+
+        self.total_vendas = cube_df['total_vendas'].to_numpy()
+        self.faturamento = cube_df['faturamento'].to_numpy()
+        self.soma_entrega = cube_df['soma_entrega'].to_numpy()
+        self.qtd_entrega = cube_df['qtd_entrega'].to_numpy()
+
+        # Código do nome da loja de cada linha (-1 se a loja não está em stores_df)
+        name_codes, self.store_names = pd.factorize(stores_df['name'])
+        store_ids = stores_df['id'].to_numpy(dtype=np.int64)
+        size = int(max(store_ids.max(initial=0), self.store_id.max(initial=0))) + 1
+        code_by_id = np.full(size, -1, dtype=np.int64)
+        code_by_id[store_ids] = name_codes
+        self.store_code = code_by_id[self.store_id]
+
+        self.first_day = int(self.dia.min(initial=0))
+        self.day_count = int(self.dia.max(initial=0)) - self.first_day + 1
+
+    def mask(self, filters):
+        'Linhas do cubo que satisfazem os filtros (equivalente ao WHERE de Filters.compile)'
+        start = (filters.start_date - EPOCH).days
+        end = (filters.end_date - EPOCH).days
+        mask = (self.dia >= start) & (self.dia <= end) & (self.store_code >= 0)
+
+        if (filters.time_start, filters.time_end) != (0, 24):
+            mask &= (self.hora >= filters.time_start) & (self.hora <= filters.time_end - 1)
+
+        if filters.store_ids is not None:
+            mask &= np.isin(self.store_id, filters.store_ids)
+
+        if filters.channel_ids is not None:
+            mask &= np.isin(self.channel_id, filters.channel_ids)
+
+        if filters.day_numbers is not None and len(filters.day_numbers) < 7:
+            mask &= np.isin(self.dia_semana, list(filters.day_numbers))
+
+        if filters.statuses is not None:
+            mask &= self.status.isin(filters.statuses).to_numpy()
+
+        return mask
+
+    def summary(self, filters):
+        '''
+        Mesmo resultado de sales_summary_query(filters): linhas de total, por dia e por loja, marcadas pela coluna
+        grupo, para separar com split_sales_summary. Não aceita filtro de produto.
+        '''
+        if filters.product_ids is not None:
+            raise ValueError("O cubo não responde filtros de produto")
+
+        mask = self.mask(filters)
+        metrics = [self.total_vendas[mask], self.faturamento[mask], self.soma_entrega[mask], self.qtd_entrega[mask]]
+
+        total = [np.array([metric.sum()], dtype=np.float64) for metric in metrics]
+
+        day_codes = self.dia[mask] - self.first_day
+        by_day = [np.bincount(day_codes, weights=metric, minlength=self.day_count) for metric in metrics]
+        days = np.flatnonzero(by_day[0])
+        by_day = [metric[days] for metric in by_day]
+
+        store_codes = self.store_code[mask]
+        by_store = [np.bincount(store_codes, weights=metric, minlength=len(self.store_names)) for metric in metrics]
+        stores = np.flatnonzero(by_store[0])
+        by_store = [metric[stores] for metric in by_store]
+
+        return pd.concat([
+            summary_rows(SUMMARY_GROUP_TOTAL, [None], [None], *total),
+            summary_rows(SUMMARY_GROUP_DAY, [EPOCH + datetime.timedelta(days=int(self.first_day + d)) for d in days], [None] * len(days), *by_day),
+            summary_rows(SUMMARY_GROUP_STORE, [None] * len(stores), self.store_names[stores], *by_store),
+        ], ignore_index=True)
+
+
+def summary_rows(group, days, stores, total_vendas, faturamento, soma_entrega, qtd_entrega):
+    'Linhas no formato de sales_summary_query a partir das somas de cada grupo. Médias sem vendas ficam NaN.'
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return pd.DataFrame({
+            'grupo': group,
+            'dia': pd.Series(days, dtype=object),
+            'loja': pd.Series(stores, dtype=object),
+            'total_vendas': total_vendas.astype(np.int64),
+            'faturamento_total': np.where(total_vendas > 0, faturamento, np.nan),
+            'ticket_medio': faturamento / total_vendas,
+            'avg_tempo_entrega_min': soma_entrega / qtd_entrega / 60.0,
+        })
@@ -0,0 +1,202 @@
+'''
+Backend alternativo: uma cópia colunar (DuckDB) das tabelas consultadas pelo app, para que as interações não
+disputem o Postgres com a operação. Este módulo não depende do Streamlit.
+
+As dimensões são copiadas inteiras a cada atualização; sales e product_sales são atualizadas de forma
+incremental, copiando de novo as linhas com id acima do maior id já copiado (a marca d'água) menos uma margem:
+linhas gravadas fora da ordem dos ids (shards paralelos do gerador, transações concorrentes) podem aparecer abaixo
+dela depois da cópia. A cada full_reload_seconds, as duas tabelas são copiadas inteiras. As cópias usam
+COPY ... TO STDOUT em CSV, lido direto pelo DuckDB, com os mesmos tipos do Postgres (DECIMAL continua exato).
+
+As queries de queries.py rodam sem alterações: apenas os parâmetros :nome viram $nome.
+'''
+
+import os
+import re
+import tempfile
+import threading
+import time
+
+import duckdb
+
+from arrow_loader import BATCH_ROWS, float_decimals, to_pandas
+from exports import write_batches
+
+# Colunas copiadas de cada tabela, com o tipo equivalente ao do Postgres
+SNAPSHOT_TABLES = {
+    'stores': {'id': 'INTEGER', 'name': 'VARCHAR'},
+    'channels': {'id': 'INTEGER', 'name': 'VARCHAR'},
+    'products': {'id': 'INTEGER', 'name': 'VARCHAR'},
+    'sales': {
+        'id': 'INTEGER', 'store_id': 'INTEGER', 'channel_id': 'INTEGER', 'created_at': 'TIMESTAMP',
+        'sale_status_desc': 'VARCHAR', 'total_amount': 'DECIMAL(10,2)', 'delivery_seconds': 'INTEGER',
+    },
+    'product_sales': {
+        'id': 'INTEGER', 'sale_id': 'INTEGER', 'product_id': 'INTEGER', 'total_price': 'DOUBLE', 'quantity': 'DOUBLE',
+    },
+}
+
+# Tabelas grandes, atualizadas por marca d'água de id; as demais são recarregadas inteiras
+INCREMENTAL_TABLES = ['sales', 'product_sales']
+
+# Faixa de ids copiada por vez, para limitar a memória na primeira cópia
+COPY_CHUNK_IDS = 500_000
+
+PARAM_PATTERN = re.compile(r'(?<!:):(\w+)')
+
+
+def to_duckdb_sql(query, params):
+    'Troca os parâmetros :nome (formato do SQLAlchemy) por $nome e retorna (sql, params usados pela query)'
+    names = set(PARAM_PATTERN.findall(query))
+    used_params = {name: value for name, value in (params or {}).items() if name in names}
+    return PARAM_PATTERN.sub(r'$\1', query), used_params
+
+
+class DuckDBSnapshot:
+    '''
+    Cópia local das tabelas de SNAPSHOT_TABLES, lida do Postgres pela engine dada.
+
+    path=':memory:' mantém a cópia só na memória; um arquivo preserva a cópia (e a marca d'água) entre
+    execuções do app. Pode ser consultada por várias threads; as atualizações são serializadas.
+    '''
+
+    def __init__(self, engine, path=':memory:', rescan_ids=10_000, full_reload_seconds=3600):
+        self.engine = engine
+        self.connection = duckdb.connect(path)
+        self.lock = threading.Lock()
+        self.rescan_ids = rescan_ids
+        self.full_reload_seconds = full_reload_seconds
+        self.refreshed_at = None
+        self.reloaded_at = None # Última cópia inteira de sales e product_sales (time.monotonic)
+        self.version = None
+
+        columns_added = False
+        for table, columns in SNAPSHOT_TABLES.items():
+            columns_sql = ', '.join(f"{name} {sql_type}" for name, sql_type in columns.items())
+            self.connection.execute(f"CREATE TABLE IF NOT EXISTS {table} ({columns_sql})")
+
+            # Uma cópia em arquivo feita por uma versão anterior ganha as colunas novas (no fim, como em SNAPSHOT_TABLES)
+            existing = {row[0] for row in self.connection.execute(
+                "SELECT column_name FROM information_schema.columns WHERE table_name = ?", [table]
+            ).fetchall()}
+            for name, sql_type in columns.items():
+                if name not in existing:
+                    self.connection.execute(f"ALTER TABLE {table} ADD COLUMN {name} {sql_type}")
+                    columns_added = True
+
+        # Uma cópia preservada em arquivo conta como recém-copiada: a próxima cópia inteira vem full_reload_seconds
+        # depois (ou já na primeira atualização, se ganhou colunas, ainda vazias)
+        if self.watermark('sales') and not columns_added:
+            self.reloaded_at = time.monotonic()
+
+    def watermark(self, table):
+        'Maior id já copiado da tabela'
+        return self.connection.execute(f"SELECT COALESCE(MAX(id), 0) FROM {table}").fetchone()[0]
+
+    def copy_rows(self, source, table, where_sql='', params=()):
+        'Copia do Postgres (conexão psycopg source) para o DuckDB as linhas da tabela que satisfazem where_sql'
+        columns = SNAPSHOT_TABLES[table]
+        select_sql = f"SELECT {', '.join(columns)} FROM {table} {where_sql}"
+        columns_sql = '{' + ', '.join(f"'{name}': '{sql_type}'" for name, sql_type in columns.items()) + '}'
+
+        # O arquivo é fechado antes do read_csv e apagado no final: no Windows um arquivo temporário aberto não
+        # pode ser aberto de novo
+        with tempfile.NamedTemporaryFile(suffix='.csv', delete=False) as f:
+            path = f.name
+        try:
+            with open(path, 'wb') as f, source.cursor().copy(f"COPY ({select_sql}) TO STDOUT (FORMAT csv)", params) as copy:
+                for block in copy:
+                    f.write(block)
+            self.connection.execute(f"""
+                INSERT INTO {table}
+                SELECT * FROM read_csv(?, header = false, columns = {columns_sql})
+            """, [path])
+        finally:
+            os.remove(path)
+
+    def refresh(self):
+        '''
+        Atualiza a cópia: recarrega as dimensões e copia de novo as vendas acima da marca d'água menos rescan_ids
+        (ou todas, se a última cópia inteira tem mais de full_reload_seconds). Tudo em uma transação, então
+        as consultas nunca veem uma cópia pela metade. Retorna a nova versão (ver version_of).
+        '''
+        with self.lock:
+            started = time.monotonic()
+            full_reload = self.reloaded_at is None or started - self.reloaded_at > self.full_reload_seconds
+            raw_connection = self.engine.raw_connection()
+            try:
+                source = raw_connection.driver_connection
+                self.connection.execute("BEGIN TRANSACTION")
+                try:
+                    for table in SNAPSHOT_TABLES:
+                        if table in INCREMENTAL_TABLES:
+                            continue
+                        self.connection.execute(f"DELETE FROM {table}")
+                        self.copy_rows(source, table)
+
+                    for table in INCREMENTAL_TABLES:
+                        last_id = 0 if full_reload else max(self.watermark(table) - self.rescan_ids, 0)
+                        self.connection.execute(f"DELETE FROM {table} WHERE id > ?", [last_id])
+                        max_id = source.execute(f"SELECT COALESCE(MAX(id), 0) FROM {table}").fetchone()[0]
+                        for start in range(last_id, max_id, COPY_CHUNK_IDS):
+                            end = min(start + COPY_CHUNK_IDS, max_id)
+                            self.copy_rows(source, table, "WHERE id > %s AND id <= %s", (start, end))
+
+                    self.connection.execute("COMMIT")
+                except Exception:
+                    self.connection.execute("ROLLBACK")
+                    raise
+            finally:
+                raw_connection.close()
+
+            self.refreshed_at = time.monotonic()
+            if full_reload:
+                self.reloaded_at = started
+            self.version = self.version_of()
+            return self.version
+
+    def refresh_if_older_than(self, max_age_seconds):
+        'Atualiza a cópia se ela nunca foi feita ou se tem mais de max_age_seconds. Retorna a versão atual.'
+        if self.refreshed_at is None or time.monotonic() - self.refreshed_at > max_age_seconds:
+            return self.refresh()
+        return self.version
+
+    def version_of(self):
+        '''
+        Identifica o conteúdo da cópia (marcas d\'água e tamanho de cada tabela, que muda com as linhas gravadas fora
+        de ordem), para usar nas chaves de cache
+        '''
+        return tuple(
+            (self.watermark(table), self.connection.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0])
+            if table in INCREMENTAL_TABLES
+            else self.connection.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+            for table in SNAPSHOT_TABLES
+        )
+
+    def query(self, query, params=None):
+        '''
+        Executa uma query do app (SQL de queries.py, com parâmetros :nome) na cópia e retorna um DataFrame com os
+        mesmos tipos da carga via Arrow no Postgres (ver arrow_loader.py): dtypes apoiados em Arrow e DECIMAL como float.
+        '''
+        sql, used_params = to_duckdb_sql(query, params)
+        cursor = self.connection.cursor() # Cada thread usa seu próprio cursor
+        try:
+            table = cursor.execute(sql, used_params).fetch_arrow_table()
+        finally:
+            cursor.close()
+
+        return to_pandas(table)
+
+    def write_export(self, query, params, file_format, out):
+        '''
+        Escreve o resultado de uma query do app (ver query) no arquivo binário out, em lotes, no formato dado (ver
+        exports.py), com os mesmos tipos da exportação pelo Postgres (DECIMAL como float).
+        '''
+        sql, used_params = to_duckdb_sql(query, params)
+        cursor = self.connection.cursor()
+        try:
+            reader = cursor.execute(sql, used_params).fetch_record_batch(BATCH_ROWS)
+            schema = float_decimals(reader.schema)
+            write_batches(schema, (batch.cast(schema) for batch in reader), file_format, out)
+        finally:
+            cursor.close()
@@ -0,0 +1,67 @@
+'''
+Exportações dos relatórios em CSV ou Parquet, geradas só quando o usuário clica para baixar. Este módulo não
+depende do Streamlit.
+
+Os arquivos são escritos em um arquivo temporário no disco, aos poucos: o resultado de uma query exportada nunca
+vira um DataFrame. Cada lote lido pelo ArrowQueryReader (com um cursor no servidor) é escrito no CSV ou vira um
+row group do Parquet; em CSV, uma query sem parâmetros vai direto do COPY ... TO STDOUT para o arquivo.
+'''
+
+import tempfile
+
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+import pyarrow.parquet as pq
+
+from arrow_loader import ArrowQueryReader
+
+EXPORT_MIME_TYPES = {
+    'csv': 'text/csv',
+    'parquet': 'application/vnd.apache.parquet',
+}
+
+
+def write_dataframe(df, file_format, out):
+    'Escreve o DataFrame (sem o índice) no arquivo binário out'
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    if file_format == 'csv':
+        pa_csv.write_csv(table, out)
+    else:
+        pq.write_table(table, out)
+
+
+def write_query(connection, query, params, file_format, out, block_size=1 << 20):
+    '''
+    Escreve o resultado da query (parâmetros :nome) no arquivo binário out, em blocos, usando a conexão psycopg.
+    A memória usada não depende do tamanho do resultado. Retorna quantas linhas foram escritas.
+    '''
+    if file_format == 'csv' and not params:
+        cursor = connection.cursor()
+        with cursor.copy(f"COPY ({query}) TO STDOUT (FORMAT csv, HEADER)") as copy:
+            for block in copy:
+                out.write(block)
+        return cursor.rowcount
+
+    with ArrowQueryReader(connection, query, params, block_size, server_cursor=True) as reader:
+        write_batches(reader.schema, reader, file_format, out)
+    return reader.rows
+
+
+def write_batches(schema, batches, file_format, out):
+    'Escreve os RecordBatches (com o schema dado) no arquivo binário out, um por vez'
+    writer_class = pa_csv.CSVWriter if file_format == 'csv' else pq.ParquetWriter
+    with writer_class(out, schema) as writer:
+        for batch in batches:
+            writer.write_batch(batch)
+
+
+def temporary_export(write):
+    '''
+    Chama write(arquivo) para escrever a exportação em um arquivo temporário no disco, e retorna o conteúdo em bytes.
+    O streamlit lê o arquivo inteiro para a memória de qualquer forma; escrever no disco evita manter os buffers dos
+    writers e o resultado na memória ao mesmo tempo. TemporaryFile é apagado ao ser fechado, inclusive no Windows.
+    '''
+    with tempfile.TemporaryFile(suffix='.export') as f:
+        write(f)
+        f.seek(0)
+        return f.read()
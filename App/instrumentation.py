@@ -0,0 +1,96 @@
+'''
+Registro das queries feitas pelo app: para cada chamada de load_data, a impressão digital do SQL, o tempo, as
+linhas, os bytes e se o resultado veio do cache. Este módulo não depende do Streamlit.
+
+A impressão digital identifica a query pelo texto com os espaços normalizados: os valores dos filtros são
+parâmetros vinculados, então a mesma query com filtros diferentes tem a mesma impressão digital.
+'''
+
+import datetime
+import hashlib
+import re
+import threading
+from collections import deque
+
+from arrow_loader import to_psycopg_sql
+
+# Listas maiores que isso aparecem resumidas nos registros (ex.: os ids de venda do filtro de produto)
+MAX_LOGGED_LIST = 20
+
+FROM_PATTERN = re.compile(r'\bFROM\s+(\w+)(?![.\w])', re.IGNORECASE) # Não pega EXTRACT(HOUR FROM s.created_at)
+
+
+def normalized_sql(query):
+    'SQL em uma linha, com os espaços normalizados'
+    return ' '.join(query.split())
+
+
+def fingerprint(query):
+    'Impressão digital curta do SQL (os parâmetros não entram)'
+    return hashlib.sha1(normalized_sql(query).encode()).hexdigest()[:12]
+
+
+def query_name(query, cache_key=None):
+    'Nome curto da query para exibição: o início da chave de cache, ou a primeira tabela do FROM'
+    if cache_key:
+        return str(cache_key[0])
+    match = FROM_PATTERN.search(query)
+    return f"FROM {match.group(1)}" if match else None
+
+
+def loggable_params(params):
+    'Parâmetros para os registros, com as listas longas resumidas'
+    return {
+        name: f"[{len(value)} valores]" if isinstance(value, (list, tuple)) and len(value) > MAX_LOGGED_LIST else value
+        for name, value in (params or {}).items()
+    }
+
+
+def explain_analyze(connection, query, params=None):
+    '''
+    Executa a query (parâmetros :nome) de novo na conexão psycopg com EXPLAIN (ANALYZE, BUFFERS) e retorna o plano
+    em texto. A query roda de verdade: o custo é o de uma segunda execução.
+    '''
+    sql, used_params = to_psycopg_sql(query, params)
+    rows = connection.execute(f"EXPLAIN (ANALYZE, BUFFERS) {sql}", used_params or None, prepare=False).fetchall()
+    return '\n'.join(row[0] for row in rows)
+
+
+def query_record(query, params, cache_key, seconds, rows, size, cache_hit, source, session=None, error=None):
+    'Registro de uma chamada de load_data (um dict, pronto para virar JSON)'
+    return {
+        'horario': datetime.datetime.now().isoformat(timespec='milliseconds'),
+        'fingerprint': fingerprint(query),
+        'nome': query_name(query, cache_key),
+        'fonte': 'cache' if cache_hit else source,
+        'cache': None if cache_key is None else ('acerto' if cache_hit else 'falha'),
+        'segundos': round(seconds, 4),
+        'linhas': rows,
+        'bytes': size,
+        'erro': error,
+        'sessao': session,
+        'sql': normalized_sql(query),
+        'params': loggable_params(params),
+        'plano': None,
+    }
+
+
+class QueryLog:
+    '''
+    Últimos max_records registros de query_record, compartilhados entre as sessões. Pode ser usado por várias
+    threads ao mesmo tempo.
+    '''
+
+    def __init__(self, max_records):
+        self.entries = deque(maxlen=max_records)
+        self.lock = threading.Lock()
+
+    def add(self, record):
+        with self.lock:
+            self.entries.append(record)
+
+    def records(self, session=None):
+        'Registros (de uma sessão, se dada), do mais recente para o mais antigo'
+        with self.lock:
+            entries = list(self.entries)
+        return [record for record in reversed(entries) if session is None or record['sessao'] == session]
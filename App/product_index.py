@@ -0,0 +1,107 @@
+'''
+Índice invertido produto -> vendas, em memória, construído a partir de product_sales. Este módulo não depende do
+Streamlit.
+
+Com ele, o conjunto de vendas que contêm os produtos filtrados é calculado uma vez por mudança de filtro e
+passado às queries como uma lista de ids (s.id = ANY(:sale_ids)), em vez de cada query repetir a subquery em
+product_sales.
+
+Cada produto guarda um array ordenado e sem repetições de ids de venda (int32, 4 bytes por par). O índice é
+atualizado de forma incremental, lendo as linhas de product_sales das vendas com id acima do maior já lido menos
+uma margem de vendas: vendas gravadas fora da ordem dos ids (shards paralelos do gerador, transações concorrentes)
+podem aparecer abaixo dele depois de lido. A margem é contada em vendas, e não em ids de product_sales, porque o
+gerador reserva vários ids de linha por venda e um shard ocupa muito mais ids de linha que de venda. Reler a
+margem não duplica nada, e a cada rebuild_seconds o índice é refeito do zero, para as vendas que caíram abaixo
+da margem.
+'''
+
+import threading
+import time
+
+import numpy as np
+
+# Linhas de product_sales das vendas novas, em lotes por id de venda (index only scan em idx_product_sales_sale)
+NEW_PRODUCT_SALES_QUERY = """
+    SELECT ps.sale_id, ps.product_id
+    FROM product_sales ps
+    WHERE ps.sale_id > :last_sale_id
+    ORDER BY ps.sale_id
+    LIMIT :batch_size
+"""
+
+EMPTY_SALE_IDS = np.empty(0, dtype=np.int32)
+
+
+class ProductSaleIndex:
+    '''
+    Índice produto -> ids de venda. Pode ser usado por várias threads; as atualizações são serializadas.
+
+    Linhas apagadas de product_sales continuam no índice até a próxima reconstrução (os dados do app só recebem inserções).
+    '''
+
+    def __init__(self, batch_size=1_000_000, rescan_sales=50_000, rebuild_seconds=600):
+        self.batch_size = batch_size
+        self.rescan_sales = rescan_sales
+        self.rebuild_seconds = rebuild_seconds
+        self.sales_by_product = {} # product_id -> array ordenado de sale_id
+        self.last_sale_id = 0
+        self.built_at = None # Hora (time.monotonic) da última reconstrução completa
+        self.lock = threading.Lock()
+
+    def refresh(self, load_data):
+        '''
+        Acrescenta as linhas das vendas novas (relendo as das rescan_sales últimas), ou refaz o índice do zero se a
+        última reconstrução tem mais de rebuild_seconds. load_data(sql, params) executa a query e retorna um
+        DataFrame (vazio e sem colunas em caso de erro). Retorna quantas linhas foram lidas, ou None se uma query
+        falhou: nesse caso o índice pode estar incompleto e não deve ser usado.
+        '''
+        with self.lock:
+            rebuild = self.built_at is None or time.monotonic() - self.built_at > self.rebuild_seconds
+            # A reconstrução monta um índice novo; o atual continua respondendo até a troca
+            sales_by_product = {} if rebuild else self.sales_by_product
+            last_sale_id = 0 if rebuild else max(self.last_sale_id - self.rescan_sales, 0)
+            started = time.monotonic()
+
+            total_rows = 0
+            while True:
+                rows = load_data(NEW_PRODUCT_SALES_QUERY, {'last_sale_id': last_sale_id, 'batch_size': self.batch_size})
+                if 'sale_id' not in rows.columns:
+                    return None
+                full_batch = len(rows) == self.batch_size
+                sale_ids = rows['sale_id'].to_numpy()
+                product_ids = rows['product_id'].to_numpy()
+                if full_batch and sale_ids[0] != sale_ids[-1]:
+                    # A última venda do lote pode ter linhas no próximo: fica para ele
+                    complete = sale_ids < sale_ids[-1]
+                    sale_ids, product_ids = sale_ids[complete], product_ids[complete]
+                if len(sale_ids):
+                    self.add(sales_by_product, product_ids, sale_ids)
+                    last_sale_id = int(sale_ids[-1])
+                    total_rows += len(sale_ids)
+                if not full_batch:
+                    break
+
+            self.sales_by_product = sales_by_product
+            self.last_sale_id = max(last_sale_id, 0 if rebuild else self.last_sale_id)
+            if rebuild:
+                self.built_at = started
+            return total_rows
+
+    @staticmethod
+    def add(sales_by_product, product_ids, sale_ids):
+        'Junta os pares (produto, venda) ao índice sales_by_product'
+        order = np.argsort(product_ids, kind='stable')
+        product_ids = product_ids[order]
+        sale_ids = sale_ids[order].astype(np.int32)
+
+        products, starts = np.unique(product_ids, return_index=True)
+        for product_id, group in zip(products.tolist(), np.split(sale_ids, starts[1:])):
+            current = sales_by_product.get(product_id, EMPTY_SALE_IDS)
+            sales_by_product[product_id] = np.union1d(current, group) # Ordenado e sem repetições
+
+    def sale_ids(self, product_ids):
+        'Ids (ordenados, sem repetições) das vendas que contêm algum dos produtos'
+        arrays = [self.sales_by_product.get(product_id, EMPTY_SALE_IDS) for product_id in product_ids]
+        if not arrays:
+            return EMPTY_SALE_IDS
+        return np.unique(np.concatenate(arrays))
@@ -0,0 +1,355 @@
+'''
+Consultas SQL do app. Este módulo não depende do Streamlit, para poder ser usado fora do app.
+
+Os filtros globais são traduzidos para IDs e compilados uma vez por execução em um WHERE com parâmetros
+vinculados (ex.: s.store_id = ANY(:store_ids)). Assim o texto de cada query só depende de quais filtros
+estão ativos, e não dos valores escolhidos: o servidor reaproveita os prepared statements e as chaves do
+cache ficam pequenas.
+
+Sem filtro de produto, todos os filtros cabem na granularidade de hora, e as queries de vendas são
+respondidas pela tabela agregada sales_hourly_rollup (hora × loja × canal × status) em vez de sales.
+'''
+
+import datetime
+
+import pandas as pd
+
+
+def ids_for(lookup_df, selected_names):
+    '''
+    Retorna os IDs das linhas de lookup_df (colunas id, name) cujo nome está em selected_names.
+
+    Retorna None se a seleção inclui todas as linhas: nesse caso nenhum filtro é necessário.
+    '''
+    mask = lookup_df['name'].isin(selected_names)
+    if mask.all():
+        return None
+    return lookup_df.loc[mask, 'id'].astype(int).tolist()
+
+
+class Filters:
+    '''
+    Filtros globais já resolvidos para IDs. Listas None significam "todos" e não geram predicado.
+
+    where_sql e params são compilados uma única vez, na construção. Se rollup_available e não há filtro de
+    produto, use_rollup é True e rollup_where_sql filtra a tabela sales_hourly_rollup (alias r).
+
+    sale_ids, se dado, são as vendas que contêm algum dos product_ids, já calculadas pelo índice em memória
+    (product_index.py): o filtro de produto vira s.id = ANY(:sale_ids), sem subquery em product_sales.
+
+    Com sales_partitioned (sales e product_sales particionadas por mês, ver database-schema.sql), o período também
+    é aplicado a product_sales.sale_created_at, para que o banco leia só as partições do período.
+
+    Com time_columns (colunas geradas sale_date, sale_hour e sale_dow em sales), hora, dia da semana e dia usam essas
+    colunas, que os índices cobrem, em vez de EXTRACT e DATE sobre created_at.
+    '''
+
+    def __init__(self, store_ids, channel_ids, product_ids, statuses, day_numbers, start_date, end_date, time_start, time_end, rollup_available=False, sale_ids=None, sales_partitioned=False, time_columns=False):
+        self.store_ids = store_ids
+        self.channel_ids = channel_ids
+        self.product_ids = product_ids
+        self.sale_ids = sale_ids
+        self.statuses = statuses
+        self.day_numbers = day_numbers
+        self.start_date = pd.to_datetime(start_date).date()
+        self.end_date = pd.to_datetime(end_date).date()
+        self.time_start = time_start
+        self.time_end = time_end
+
+        self.rollup_available = rollup_available
+        self.use_rollup = rollup_available and product_ids is None
+        self.sales_partitioned = sales_partitioned
+        self.time_columns = time_columns
+        self.sale_date_sql = "s.sale_date" if time_columns else "DATE(s.created_at)"
+
+        self.where_sql, self.params = self.compile('s', 'created_at', time_columns)
+        if self.use_rollup:
+            self.rollup_where_sql, _ = self.compile('r', 'hour')
+
+    def compile(self, alias, time_column, time_columns=False):
+        '''
+        Retorna (where_sql, params) para a tabela com o alias dado, cuja coluna de tempo é time_column.
+        O período é semiaberto: inclui o dia final inteiro. Com time_columns, hora e dia da semana vêm das
+        colunas geradas sale_hour e sale_dow.
+        '''
+        t = f"{alias}.{time_column}"
+        hour_sql = f"{alias}.sale_hour" if time_columns else f"EXTRACT(HOUR FROM {t})"
+        dow_sql = f"{alias}.sale_dow" if time_columns else f"EXTRACT(DOW FROM {t})"
+        where_clauses = [
+            f"{t} >= :start_date",
+            f"{t} < :end_date",
+        ]
+        params = {
+            'start_date': self.start_date,
+            'end_date': self.end_date + datetime.timedelta(days=1),
+        }
+
+        if self.store_ids is not None:
+            where_clauses.append(f"{alias}.store_id = ANY(:store_ids)")
+            params['store_ids'] = self.store_ids
+
+        if self.channel_ids is not None:
+            where_clauses.append(f"{alias}.channel_id = ANY(:channel_ids)")
+            params['channel_ids'] = self.channel_ids
+
+        if (self.time_start, self.time_end) != (0, 24):
+            where_clauses.append(f"{hour_sql} BETWEEN :hour_start AND :hour_end")
+            params['hour_start'] = self.time_start
+            params['hour_end'] = self.time_end - 1 # Subtraímos 1 porque BETWEEN é inclusivo
+
+        if self.sale_ids is not None:
+            where_clauses.append(f"{alias}.id = ANY(:sale_ids)")
+            params['sale_ids'] = self.sale_ids
+        elif self.product_ids is not None:
+            # Vendas contendo algum dos produtos; não precisa da tabela products
+            where_clauses.append(f"""{alias}.id IN (
+                    SELECT ps_filter.sale_id
+                    FROM product_sales ps_filter
+                    WHERE ps_filter.product_id = ANY(:product_ids)
+                    {self.product_sales_period_sql('ps_filter')}
+                )""")
+            params['product_ids'] = self.product_ids
+
+        if self.day_numbers is not None and len(self.day_numbers) < 7:
+            where_clauses.append(f"{dow_sql} = ANY(:day_numbers)")
+            params['day_numbers'] = list(self.day_numbers)
+
+        if self.statuses is not None:
+            where_clauses.append(f"{alias}.sale_status_desc = ANY(:statuses)")
+            params['statuses'] = list(self.statuses)
+
+        return "WHERE " + " AND ".join(where_clauses), params
+
+    def product_sales_period_sql(self, alias):
+        'Com sales particionada, restringe product_sales (com o alias dado) ao período, para descartar partições'
+        if not self.sales_partitioned:
+            return ""
+        return f"AND {alias}.sale_created_at >= :start_date AND {alias}.sale_created_at < :end_date"
+
+    def cache_key(self):
+        '''
+        Tupla normalizada dos filtros, para as chaves do cache de resultados: listas ordenadas e seleções
+        equivalentes (ex.: todos os dias da semana, ou nenhum filtro de dia) com a mesma chave.
+        '''
+        def normalized(values):
+            return None if values is None else tuple(sorted(values))
+
+        day_numbers = self.day_numbers
+        if day_numbers is not None and len(day_numbers) >= 7:
+            day_numbers = None
+
+        return (
+            normalized(self.store_ids),
+            normalized(self.channel_ids),
+            normalized(self.product_ids),
+            normalized(self.statuses),
+            normalized(day_numbers),
+            self.start_date,
+            self.end_date,
+            self.time_start,
+            self.time_end,
+        )
+
+
+# Marca d'água do cache de resultados: muda quando entram vendas novas
+WATERMARK_QUERY = "SELECT COALESCE(MAX(id), 0) as watermark FROM sales"
+
+# Recursos opcionais do schema (ver database-schema.sql): layout particionado, em que product_sales guarda a data
+# da venda, colunas geradas de tempo em sales e o catálogo de status
+SCHEMA_FEATURES_QUERY = """
+    SELECT
+        COUNT(*) FILTER (WHERE table_name = 'product_sales' AND column_name = 'sale_created_at') > 0 as particionado,
+        COUNT(*) FILTER (WHERE table_name = 'sales' AND column_name = 'sale_hour') > 0 as colunas_de_tempo,
+        COUNT(*) FILTER (WHERE table_name = 'sale_statuses') > 0 as catalogo_de_status
+    FROM information_schema.columns
+    WHERE table_schema = current_schema()
+"""
+
+# Status de venda existentes: do catálogo mantido por triggers, ou (sem ele) de uma leitura inteira de sales
+STATUS_CATALOG_QUERY = "SELECT name as sale_status_desc FROM sale_statuses ORDER BY name"
+STATUS_SCAN_QUERY = "SELECT DISTINCT sale_status_desc FROM sales"
+
+ROLLUP_AVAILABLE_QUERY = """
+    SELECT to_regclass('sales_hourly_rollup') IS NOT NULL
+        AND to_regclass('sales_rollup_watermark') IS NOT NULL as existe
+"""
+
+# A agregada só responde se já incluir todas as vendas
+ROLLUP_UP_TO_DATE_QUERY = """
+    SELECT w.last_sale_id >= (SELECT COALESCE(MAX(id), 0) FROM sales) as em_dia
+    FROM sales_rollup_watermark w
+"""
+
+# Reagrega as horas que receberam vendas depois da última atualização (função do schema); retorna quantas horas
+ROLLUP_REFRESH_QUERY = "SELECT refresh_sales_hourly_rollup() as horas"
+
+
+def limit_sql(limit):
+    return f"\nLIMIT {int(limit)}" if limit else ""
+
+
+def sales_summary_query(filters):
+    '''
+    KPIs gerais, faturamento por dia e métricas por loja em uma única passada, com GROUPING SETS.
+    A coluna grupo indica o agrupamento de cada linha (ver split_sales_summary). Retorna (sql, params).
+    '''
+    if filters.use_rollup:
+        sql = f"""
+            SELECT
+                GROUPING(DATE(r.hour), st.name) as grupo,
+                DATE(r.hour) as dia,
+                st.name as loja,
+                COALESCE(SUM(r.sales_count), 0) as total_vendas,
+                SUM(r.total_amount) as faturamento_total,
+                SUM(r.total_amount) / NULLIF(SUM(r.sales_count), 0) as ticket_medio,
+                SUM(r.delivery_seconds_sum) / NULLIF(SUM(r.delivery_count), 0) / 60.0 as avg_tempo_entrega_min
+            FROM sales_hourly_rollup r
+            JOIN stores st ON r.store_id = st.id
+            {filters.rollup_where_sql}
+            GROUP BY GROUPING SETS ((), (DATE(r.hour)), (st.name))
+        """
+        return sql, filters.params
+
+    sql = f"""
+        SELECT
+            GROUPING({filters.sale_date_sql}, st.name) as grupo,
+            {filters.sale_date_sql} as dia,
+            st.name as loja,
+            COUNT(s.id) as total_vendas,
+            SUM(s.total_amount) as faturamento_total,
+            AVG(s.total_amount) as ticket_medio,
+            AVG(s.delivery_seconds / 60.0) as avg_tempo_entrega_min
+        FROM sales s
+        JOIN stores st ON s.store_id = st.id
+        {filters.where_sql}
+        GROUP BY GROUPING SETS ((), ({filters.sale_date_sql}), (st.name))
+    """
+    return sql, filters.params
+
+
+# Valores da coluna grupo: GROUPING(dia, loja) marca com 1 as colunas fora do agrupamento
+SUMMARY_GROUP_TOTAL = 3
+SUMMARY_GROUP_DAY = 1
+SUMMARY_GROUP_STORE = 2
+
+
+def split_sales_summary(summary, limit=None):
+    '''
+    Separa o resultado de sales_summary_query em três DataFrames: KPIs (uma linha), faturamento por dia
+    (dia, faturamento) e métricas por loja (por faturamento decrescente).
+    '''
+    if summary.empty:
+        return pd.DataFrame(), pd.DataFrame(), pd.DataFrame()
+
+    metrics = ['total_vendas', 'faturamento_total', 'ticket_medio', 'avg_tempo_entrega_min']
+
+    kpi_data = summary.loc[summary['grupo'] == SUMMARY_GROUP_TOTAL, metrics].reset_index(drop=True)
+    kpi_data = kpi_data.astype(object).where(kpi_data.notna(), None) # Sem vendas, as médias são None
+
+    chart_data = (
+        summary.loc[summary['grupo'] == SUMMARY_GROUP_DAY, ['dia', 'faturamento_total']]
+        .rename(columns={'faturamento_total': 'faturamento'})
+        .sort_values('dia')
+        .reset_index(drop=True)
+    )
+
+    store_data = (
+        summary.loc[summary['grupo'] == SUMMARY_GROUP_STORE, ['loja'] + metrics]
+        .sort_values('faturamento_total', ascending=False)
+        .reset_index(drop=True)
+    )
+    if limit:
+        store_data = store_data.head(limit)
+
+    return kpi_data, chart_data, store_data
+
+
+def cube_query(use_rollup, time_columns=False):
+    '''
+    Fatos do cubo em memória (ver cube.py): vendas agregadas por dia × hora × loja × canal × status, sem filtros.
+    O dia vem como número de dias desde 1970-01-01. Com time_columns, usa as colunas geradas de sales.
+    Retorna (sql, params).
+    '''
+    if use_rollup:
+        sql = """
+            SELECT
+                DATE(r.hour) - DATE '1970-01-01' as dia,
+                CAST(EXTRACT(HOUR FROM r.hour) AS INTEGER) as hora,
+                CAST(EXTRACT(DOW FROM r.hour) AS INTEGER) as dia_semana,
+                r.store_id,
+                r.channel_id,
+                r.sale_status_desc,
+                r.sales_count as total_vendas,
+                r.total_amount as faturamento,
+                r.delivery_seconds_sum as soma_entrega,
+                r.delivery_count as qtd_entrega
+            FROM sales_hourly_rollup r
+        """
+        return sql, None
+
+    if time_columns:
+        day_sql, hour_sql, dow_sql = "s.sale_date", "s.sale_hour", "s.sale_dow"
+    else:
+        day_sql, hour_sql, dow_sql = "DATE(s.created_at)", "EXTRACT(HOUR FROM s.created_at)", "EXTRACT(DOW FROM s.created_at)"
+
+    sql = f"""
+        SELECT
+            {day_sql} - DATE '1970-01-01' as dia,
+            CAST({hour_sql} AS INTEGER) as hora,
+            CAST({dow_sql} AS INTEGER) as dia_semana,
+            s.store_id,
+            s.channel_id,
+            s.sale_status_desc,
+            COUNT(s.id) as total_vendas,
+            SUM(s.total_amount) as faturamento,
+            SUM(s.delivery_seconds) as soma_entrega,
+            COUNT(s.delivery_seconds) as qtd_entrega
+        FROM sales s
+        GROUP BY 1, 2, 3, 4, 5, 6
+    """
+    return sql, None
+
+
+def product_query(filters, limit=None):
+    'Quantidade e faturamento por produto. Retorna (sql, params).'
+    sql = f"""
+        SELECT
+            p.name as produto,
+            COUNT(ps.id) as quantidade_vendida,
+            SUM(ps.total_price) as faturamento_produto
+        FROM product_sales ps
+        JOIN products p ON ps.product_id = p.id
+        JOIN sales s ON ps.sale_id = s.id
+        {filters.where_sql}
+        {filters.product_sales_period_sql('ps')}
+        GROUP BY p.name
+        ORDER BY faturamento_produto DESC
+    """ + limit_sql(limit)
+    return sql, filters.params
+
+
+def sale_lines_query(filters):
+    '''
+    Itens vendidos (vendas × produtos), um por linha, das vendas que satisfazem os filtros: para a exportação
+    completa, que pode ter milhões de linhas. Sem ORDER BY, para o resultado começar a chegar sem esperar uma
+    ordenação. Retorna (sql, params).
+    '''
+    sql = f"""
+        SELECT
+            s.id as venda,
+            s.created_at as data_hora,
+            st.name as loja,
+            ch.name as canal,
+            s.sale_status_desc as status,
+            p.name as produto,
+            ps.quantity as quantidade,
+            ps.total_price as valor
+        FROM product_sales ps
+        JOIN sales s ON ps.sale_id = s.id
+        JOIN stores st ON s.store_id = st.id
+        JOIN channels ch ON s.channel_id = ch.id
+        JOIN products p ON ps.product_id = p.id
+        {filters.where_sql}
+        {filters.product_sales_period_sql('ps')}
+    """
+    return sql, filters.params
@@ -0,0 +1,94 @@
+'''
+Cache dos resultados das queries do app, compartilhado entre as sessões. Este módulo não depende do Streamlit.
+
+As chaves são tuplas normalizadas (ver Filters.cache_key), e não o texto do SQL. O cache é limitado em número
+de entradas e em bytes, descartando as usadas há mais tempo (LRU), e é esvaziado quando a marca d'água dos
+dados (o maior id de sales) muda: assim vendas novas aparecem sem reiniciar o app.
+'''
+
+import threading
+from collections import OrderedDict
+
+
+def dataframe_bytes(df):
+    'Memória ocupada pelo DataFrame, incluindo o conteúdo das strings'
+    return int(df.memory_usage(index=True, deep=True).sum())
+
+
+class ResultCache:
+    '''
+    Cache LRU de DataFrames, com no máximo max_entries entradas e max_bytes bytes.
+
+    Os DataFrames retornados por get são compartilhados: não devem ser alterados no lugar. Pode ser usado por
+    várias threads ao mesmo tempo.
+    '''
+
+    def __init__(self, max_entries, max_bytes):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict() # chave -> (DataFrame, bytes), da usada há mais tempo para a mais recente
+        self.total_bytes = 0
+        self.watermark = None
+        self.lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def validate(self, watermark):
+        'Esvazia o cache se a marca d\'água mudou desde a última chamada'
+        with self.lock:
+            if watermark != self.watermark:
+                if self.entries:
+                    self.invalidations += 1
+                self.entries.clear()
+                self.total_bytes = 0
+                self.watermark = watermark
+
+    def get(self, key):
+        'Retorna o DataFrame guardado com a chave, ou None'
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, df):
+        '''
+        Guarda o DataFrame e descarta as entradas mais antigas até caber nos limites. Retorna False, sem guardar, se
+        o DataFrame sozinho é maior que max_bytes.
+        '''
+        size = dataframe_bytes(df)
+        if size > self.max_bytes:
+            return False # Maior que o cache inteiro: não vale a pena guardar
+
+        with self.lock:
+            old = self.entries.pop(key, None)
+            if old is not None:
+                self.total_bytes -= old[1]
+            self.entries[key] = (df, size)
+            self.total_bytes += size
+
+            while len(self.entries) > self.max_entries or self.total_bytes > self.max_bytes:
+                _, (_, evicted_size) = self.entries.popitem(last=False)
+                self.total_bytes -= evicted_size
+                self.evictions += 1
+        return True
+
+    def stats(self):
+        'Contadores do cache, para exibição'
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'entradas': len(self.entries),
+                'mb': round(self.total_bytes / 1024**2, 2),
+                'acertos': self.hits,
+                'falhas': self.misses,
+                'taxa_de_acerto': round(self.hits / lookups, 3) if lookups else None,
+                'descartes': self.evictions,
+                'invalidações': self.invalidations,
+            }
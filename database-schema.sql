@@ -109,6 +109,12 @@ CREATE TABLE sales (
     created_at TIMESTAMP NOT NULL,
     customer_name VARCHAR(100),
     sale_status_desc VARCHAR(100) NOT NULL,
+
+    -- Derived from created_at, so date/hour/weekday filters and groupings can use indexes
+    -- (generate_data.py migrate adds them to databases created before they existed)
+    sale_date DATE GENERATED ALWAYS AS (created_at::date) STORED,
+    sale_hour SMALLINT GENERATED ALWAYS AS (EXTRACT(HOUR FROM created_at)::smallint) STORED,
+    sale_dow SMALLINT GENERATED ALWAYS AS (EXTRACT(DOW FROM created_at)::smallint) STORED,
     
     -- Financial values
     total_amount_items DECIMAL(10,2) NOT NULL,
@@ -233,4 +239,250 @@ CREATE TABLE coupon_sales (
     value FLOAT,
     target VARCHAR(100),
     sponsorship VARCHAR(100)
-);
\ No newline at end of file
+);
+-- Pre-aggregated summaries, filled by generate_data.py --rollups
+CREATE TABLE sales_hourly_rollup (
+    hour TIMESTAMP NOT NULL,
+    store_id INTEGER NOT NULL REFERENCES stores(id),
+    channel_id INTEGER NOT NULL REFERENCES channels(id),
+    sale_status_desc VARCHAR(100) NOT NULL,
+    sales_count INTEGER NOT NULL,
+    total_amount DECIMAL(14,2) NOT NULL,
+    total_discount DECIMAL(14,2) NOT NULL,
+    production_seconds_sum BIGINT NOT NULL,
+    production_count INTEGER NOT NULL,
+    delivery_seconds_sum BIGINT NOT NULL,
+    delivery_count INTEGER NOT NULL,
+    PRIMARY KEY (hour, store_id, channel_id, sale_status_desc)
+);
+
+CREATE TABLE product_daily_rollup (
+    day DATE NOT NULL,
+    product_id INTEGER NOT NULL REFERENCES products(id),
+    sale_status_desc VARCHAR(100) NOT NULL,
+    line_count INTEGER NOT NULL,
+    quantity FLOAT NOT NULL,
+    revenue FLOAT NOT NULL,
+    PRIMARY KEY (day, product_id, sale_status_desc)
+);
+
+-- Incremental refresh of sales_hourly_rollup: last sale id already aggregated
+CREATE TABLE sales_rollup_watermark (
+    singleton BOOLEAN PRIMARY KEY DEFAULT true CHECK (singleton),
+    last_sale_id INTEGER NOT NULL DEFAULT 0,
+    refreshed_at TIMESTAMP
+);
+INSERT INTO sales_rollup_watermark DEFAULT VALUES;
+
+-- Re-aggregates every hour that received sales past the watermark and returns how many hours
+-- were rewritten. Called by the generator after its runs and by the dashboard whenever the
+-- watermark is behind MAX(sales.id), so sales inserted by anything else are picked up on the next
+-- page load. Assumes sale ids are committed in increasing order; changes to already-aggregated
+-- sales need full_refresh => true. The generator commits its shards out of id order, so after
+-- each run it lowers the watermark below the run's first sale id before calling this.
+CREATE OR REPLACE FUNCTION refresh_sales_hourly_rollup(full_refresh BOOLEAN DEFAULT false)
+RETURNS INTEGER AS $$
+DECLARE
+    last_id INTEGER;
+    new_last_id INTEGER;
+    hours TIMESTAMP[];
+BEGIN
+    SELECT last_sale_id INTO last_id FROM sales_rollup_watermark FOR UPDATE;
+    IF full_refresh THEN
+        TRUNCATE sales_hourly_rollup;
+        last_id := 0;
+    END IF;
+    SELECT COALESCE(MAX(id), 0) INTO new_last_id FROM sales;
+
+    SELECT array_agg(DISTINCT date_trunc('hour', created_at)) INTO hours
+    FROM sales WHERE id > last_id AND id <= new_last_id;
+
+    IF hours IS NOT NULL THEN
+        DELETE FROM sales_hourly_rollup WHERE hour = ANY(hours);
+        INSERT INTO sales_hourly_rollup (
+            hour, store_id, channel_id, sale_status_desc, sales_count,
+            total_amount, total_discount, production_seconds_sum, production_count,
+            delivery_seconds_sum, delivery_count
+        )
+        SELECT
+            date_trunc('hour', created_at), store_id, channel_id, sale_status_desc, COUNT(*),
+            SUM(total_amount), COALESCE(SUM(total_discount), 0),
+            COALESCE(SUM(production_seconds), 0), COUNT(production_seconds),
+            COALESCE(SUM(delivery_seconds), 0), COUNT(delivery_seconds)
+        FROM sales
+        WHERE created_at >= (SELECT MIN(h) FROM unnest(hours) h)
+          AND created_at < (SELECT MAX(h) FROM unnest(hours) h) + INTERVAL '1 hour'
+          AND date_trunc('hour', created_at) = ANY(hours)
+        GROUP BY 1, 2, 3, 4;
+    END IF;
+
+    UPDATE sales_rollup_watermark SET last_sale_id = new_last_id, refreshed_at = clock_timestamp();
+    RETURN COALESCE(array_length(hours, 1), 0);
+END;
+$$ LANGUAGE plpgsql;
+
+-- Sale statuses in use, so listing them (the dashboard's status filter) does not scan sales.
+-- Statement-level triggers add the statuses of every INSERT (COPY included) and UPDATE on sales
+-- with one INSERT ... SELECT DISTINCT per statement; statuses are never removed.
+-- (generate_data.py migrate adds the catalog to databases created before it existed)
+CREATE TABLE sale_statuses (
+    name VARCHAR(100) PRIMARY KEY
+);
+
+CREATE OR REPLACE FUNCTION record_sale_statuses()
+RETURNS TRIGGER AS $$
+BEGIN
+    INSERT INTO sale_statuses (name)
+    SELECT DISTINCT sale_status_desc FROM new_sales
+    ON CONFLICT DO NOTHING;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER sales_record_statuses_insert AFTER INSERT ON sales
+    REFERENCING NEW TABLE AS new_sales FOR EACH STATEMENT EXECUTE FUNCTION record_sale_statuses();
+CREATE TRIGGER sales_record_statuses_update AFTER UPDATE ON sales
+    REFERENCING NEW TABLE AS new_sales FOR EACH STATEMENT EXECUTE FUNCTION record_sale_statuses();
+
+-- Optional monthly range partitioning of sales (generate_data.py --partition-sales).
+-- product_sales stores its sale's created_at as sale_created_at and is partitioned on it with
+-- the same monthly bounds, so a date filter prunes both tables and their join can run
+-- partition by partition. A partitioned table's primary key must include the partition key,
+-- so sales(id) is no longer unique on its own: product_sales references sales(id, created_at),
+-- while item_product_sales, delivery_sales, delivery_addresses, payments and coupon_sales keep
+-- their ids without foreign keys to the partitioned tables.
+
+-- Sales whose month has no partition yet land in the DEFAULT partitions sales_default and
+-- product_sales_default, so inserts never fail for lack of a partition; the dashboard's date
+-- filters still prune down to the default partition plus the months in range.
+
+-- Creates the missing monthly partitions of sales and product_sales from first_month through
+-- last_month and returns how many months were added. Rows of those months already sitting in the
+-- DEFAULT partitions are moved into the new ones. Does nothing while sales is not partitioned.
+-- The generator runs it for its runs plus a few months; for sales inserted by anything else,
+-- run it ahead of time on a schedule, e.g. monthly from cron:
+--   SELECT create_sales_partitions(current_date, (current_date + INTERVAL '3 months')::date);
+CREATE OR REPLACE FUNCTION create_sales_partitions(first_month DATE, last_month DATE)
+RETURNS INTEGER AS $$
+DECLARE
+    month_start DATE := date_trunc('month', first_month);
+    month_end DATE;
+    suffix TEXT;
+    created INTEGER := 0;
+    sales_columns TEXT;
+    lines_columns TEXT;
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = 'sales'::regclass) THEN
+        RETURN 0;
+    END IF;
+
+    -- Databases partitioned before the DEFAULT partitions existed get them here
+    IF to_regclass('sales_default') IS NULL THEN
+        CREATE TABLE sales_default PARTITION OF sales DEFAULT;
+    END IF;
+    IF to_regclass('product_sales_default') IS NULL THEN
+        CREATE TABLE product_sales_default PARTITION OF product_sales DEFAULT;
+    END IF;
+
+    -- Columns written when moving rows (generated columns are computed again)
+    SELECT string_agg(quote_ident(attname), ', ' ORDER BY attnum) INTO sales_columns
+    FROM pg_attribute WHERE attrelid = 'sales'::regclass AND attnum > 0 AND NOT attisdropped AND attgenerated = '';
+    SELECT string_agg(quote_ident(attname), ', ' ORDER BY attnum) INTO lines_columns
+    FROM pg_attribute WHERE attrelid = 'product_sales'::regclass AND attnum > 0 AND NOT attisdropped AND attgenerated = '';
+
+    WHILE month_start <= last_month LOOP
+        month_end := month_start + INTERVAL '1 month';
+        suffix := to_char(month_start, '"y"YYYY"m"MM');
+        IF to_regclass('sales_' || suffix) IS NULL THEN
+            -- The new partition cannot be created while the default one holds rows of its month:
+            -- take them out (product lines first, as deleting a sale cascades to its lines)
+            EXECUTE format('CREATE TEMP TABLE moved_product_sales AS SELECT %s FROM product_sales_default
+                            WHERE sale_created_at >= %L AND sale_created_at < %L', lines_columns, month_start, month_end);
+            EXECUTE format('CREATE TEMP TABLE moved_sales AS SELECT %s FROM sales_default
+                            WHERE created_at >= %L AND created_at < %L', sales_columns, month_start, month_end);
+            DELETE FROM product_sales_default WHERE sale_created_at >= month_start AND sale_created_at < month_end;
+            DELETE FROM sales_default WHERE created_at >= month_start AND created_at < month_end;
+
+            EXECUTE format('CREATE TABLE %I PARTITION OF sales FOR VALUES FROM (%L) TO (%L)',
+                           'sales_' || suffix, month_start, month_end);
+            created := created + 1;
+        END IF;
+        IF to_regclass('product_sales_' || suffix) IS NULL THEN
+            EXECUTE format('CREATE TABLE %I PARTITION OF product_sales FOR VALUES FROM (%L) TO (%L)',
+                           'product_sales_' || suffix, month_start, month_end);
+        END IF;
+        IF to_regclass('pg_temp.moved_sales') IS NOT NULL THEN
+            EXECUTE format('INSERT INTO sales (%s) SELECT %s FROM moved_sales', sales_columns, sales_columns);
+            EXECUTE format('INSERT INTO product_sales (%s) SELECT %s FROM moved_product_sales', lines_columns, lines_columns);
+            DROP TABLE moved_sales, moved_product_sales;
+        END IF;
+        month_start := month_end;
+    END LOOP;
+    RETURN created;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Turns the (empty) sales and product_sales tables into the partitioned layout described above,
+-- keeping their columns, defaults, checks, id sequences, triggers and foreign keys to other tables.
+-- Does nothing if sales is already partitioned.
+CREATE OR REPLACE FUNCTION partition_sales_by_month()
+RETURNS VOID AS $$
+DECLARE
+    table_name TEXT;
+    fk RECORD;
+    foreign_keys TEXT[] := '{}';
+    triggers TEXT[];
+    statement TEXT;
+BEGIN
+    IF EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = 'sales'::regclass) THEN
+        RETURN;
+    END IF;
+    IF EXISTS (SELECT 1 FROM sales) OR EXISTS (SELECT 1 FROM product_sales) THEN
+        RAISE EXCEPTION 'partition_sales_by_month needs empty sales and product_sales tables';
+    END IF;
+
+    -- Foreign keys to other tables survive; the one between the two tables is rebuilt below
+    FOR fk IN
+        SELECT conrelid::regclass::text AS table_name, conname, pg_get_constraintdef(oid) AS definition
+        FROM pg_constraint
+        WHERE conrelid IN ('sales'::regclass, 'product_sales'::regclass) AND contype = 'f'
+          AND confrelid NOT IN ('sales'::regclass, 'product_sales'::regclass)
+    LOOP
+        foreign_keys := foreign_keys || format('ALTER TABLE %I ADD CONSTRAINT %I %s',
+                                               fk.table_name, fk.conname, fk.definition);
+    END LOOP;
+
+    -- LIKE does not copy triggers: their definitions name the tables, so they apply to the new ones
+    SELECT COALESCE(array_agg(pg_get_triggerdef(oid)), '{}') INTO triggers
+    FROM pg_trigger
+    WHERE tgrelid IN ('sales'::regclass, 'product_sales'::regclass) AND NOT tgisinternal;
+
+    FOREACH table_name IN ARRAY ARRAY['sales', 'product_sales'] LOOP
+        EXECUTE format('ALTER SEQUENCE %I OWNED BY NONE', table_name || '_id_seq');
+        EXECUTE format('ALTER TABLE %I RENAME TO %I', table_name, table_name || '_unpartitioned');
+    END LOOP;
+
+    CREATE TABLE sales (LIKE sales_unpartitioned INCLUDING DEFAULTS INCLUDING CONSTRAINTS INCLUDING GENERATED)
+        PARTITION BY RANGE (created_at);
+    CREATE TABLE product_sales (
+        LIKE product_sales_unpartitioned INCLUDING DEFAULTS INCLUDING CONSTRAINTS INCLUDING GENERATED,
+        sale_created_at TIMESTAMP NOT NULL
+    ) PARTITION BY RANGE (sale_created_at);
+
+    -- Dropping the old tables also drops the foreign keys other tables had to them
+    DROP TABLE product_sales_unpartitioned, sales_unpartitioned CASCADE;
+    ALTER SEQUENCE sales_id_seq OWNED BY sales.id;
+    ALTER SEQUENCE product_sales_id_seq OWNED BY product_sales.id;
+
+    ALTER TABLE sales ADD CONSTRAINT sales_pkey PRIMARY KEY (id, created_at);
+    ALTER TABLE product_sales ADD CONSTRAINT product_sales_pkey PRIMARY KEY (id, sale_created_at);
+    ALTER TABLE product_sales ADD CONSTRAINT product_sales_sale_id_fkey FOREIGN KEY (sale_id, sale_created_at)
+        REFERENCES sales(id, created_at) ON DELETE CASCADE;
+    FOREACH statement IN ARRAY foreign_keys || triggers LOOP
+        EXECUTE statement;
+    END LOOP;
+
+    CREATE TABLE sales_default PARTITION OF sales DEFAULT;
+    CREATE TABLE product_sales_default PARTITION OF product_sales DEFAULT;
+END;
+$$ LANGUAGE plpgsql;